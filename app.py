@@ -1,14 +1,44 @@
-from flask import Flask, render_template, jsonify, request, Response, send_file, redirect, url_for, session
+from flask import Flask, render_template, jsonify, request, Response, send_file, redirect, url_for, session, make_response
 import requests
+from requests.adapters import HTTPAdapter
 from functools import lru_cache, wraps
 from datetime import datetime, timedelta
 import json
 import os
+import sys
 import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
 from io import BytesIO
 
 app = Flask(__name__)
 
+# ============ JSON (orjson) ============
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    class OrjsonProvider(JSONProvider):
+        """jsonify & session pakai orjson (C) alih-alih json stdlib."""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=DefaultJSONProvider.default, option=ORJSON_OPTIONS).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            body = orjson.dumps(obj, default=DefaultJSONProvider.default, option=ORJSON_OPTIONS)
+            return self._app.response_class(body, mimetype='application/json')
+
+    app.json = OrjsonProvider(app)
+except ImportError:
+    orjson = None
+
 # ============ REDIRECT — WEBSITE PINDAH KE ANIMEKU.ID ============
 NEW_DOMAIN = "https://animeku-id.vercel.app"
 BYPASS_PATHS = ['/static/', '/api/proxy-image']  # jangan intercept static files
@@ -44,7 +74,28 @@ except ImportError:
     pass
 
 app.config['PREFERRED_URL_SCHEME'] = 'https'
+
+# ============ COMPRESSION (Optional) ============
+# Flask-Compress juga menambahkan Vary: Accept-Encoding
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 1024
+try:
+    from flask_compress import Compress
+    Compress(app)
+except ImportError:
+    print("⚠️ Flask-Compress not installed, responses sent uncompressed")
 API_BASE = "https://www.sankavollerei.com"
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+
+# ============ HTTP SESSION (keep-alive pool) ============
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0)
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
+SESSION.headers.update(HEADERS)
 
 # ============ SUPABASE (Optional) ============
 SUPABASE_URL = os.environ.get('SUPABASE_URL')
@@ -149,7 +200,8 @@ def api_me():
 
 # ============ CACHE ============
 NOTIFICATIONS = []
-CACHE = {}
+MAX_JSON = 512
+CACHE = OrderedDict()
 CACHE_DURATION = {
     'home': 300,
     'ongoing': 300,
@@ -163,32 +215,196 @@ CACHE_DURATION = {
     'server': 60,
     'batch': 600
 }
+DEFAULT_TTL = 300
 
 # ============ IMAGE CACHE ============
 IMAGE_CACHE_DIR = '/tmp/poster_cache'  # ✅ /tmp agar bisa ditulis di Vercel
 IMAGE_CACHE_DURATION_DAYS = 30
-IMAGE_CACHE = {}
+MAX_IMAGES = 200
+IMAGE_CACHE_MAX_BYTES = 5 * 1024 * 1024  # gambar lebih besar dari ini tidak di-cache
+IMAGE_STREAM_CHUNK = 64 * 1024
+IMAGE_CACHE = OrderedDict()
+CACHE_SWEEP_INTERVAL = 60
+
+# RLock: _save_image_entry dipanggil dari is_image_cached yang sudah pegang lock
+_cache_lock = threading.RLock()
 
 os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
 
+def dump_json_bytes(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=ORJSON_OPTIONS)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def load_json_bytes(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# Payload JSON disimpan sebagai blob gzip (level 1, cepat): hemat memori & bisa langsung dikirim ke client
+GZIP_WBITS = 31
+
+def gzip_bytes(raw):
+    compressor = zlib.compressobj(1, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(raw) + compressor.flush()
+
+def json_response(blob, status=200):
+    """Kirim blob JSON gzip dari cache apa adanya; di-decompress hanya kalau client tidak terima gzip."""
+    if request.accept_encodings['gzip'] > 0:
+        response = Response(blob, status=status, mimetype='application/json')
+        # Flask-Compress melewati response yang sudah punya Content-Encoding
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(zlib.decompress(blob, GZIP_WBITS), status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
+def get_blob_from_cache(cache_key):
+    blob = None
+    with _cache_lock:
+        if cache_key in CACHE:
+            cached_time, cache_type, blob = CACHE[cache_key]
+            if time.monotonic() - cached_time < CACHE_DURATION.get(cache_type, DEFAULT_TTL):
+                CACHE.move_to_end(cache_key)
+            else:
+                blob = None
+    return blob
+
+def get_raw_from_cache(cache_key):
+    blob = get_blob_from_cache(cache_key)
+    if blob is None:
+        return None
+    return zlib.decompress(blob, GZIP_WBITS)
+
 def get_from_cache(cache_key):
-    if cache_key in CACHE:
-        cached_time, cache_type, data = CACHE[cache_key]
-        max_age = CACHE_DURATION.get(cache_type, 300)
-        if datetime.now() - cached_time < timedelta(seconds=max_age):
-            return data
-    return None
+    raw = get_raw_from_cache(cache_key)
+    if raw is None:
+        return None
+    return load_json_bytes(raw)
 
 def save_to_cache(cache_key, data, cache_type='home'):
-    CACHE[cache_key] = (datetime.now(), cache_type, data)
+    blob = gzip_bytes(dump_json_bytes(data))
+    with _cache_lock:
+        if cache_key in CACHE:
+            CACHE.move_to_end(cache_key)
+        elif len(CACHE) >= MAX_JSON:
+            CACHE.popitem(last=False)
+        # cached_time pakai time.monotonic(): float murah & tidak terpengaruh perubahan jam
+        CACHE[cache_key] = (time.monotonic(), cache_type, blob)
+
+# ============ RATE LIMIT (sliding window) ============
+RATE_LIMIT_RPM = 55
+RATE_LIMIT_MAX_WAIT = 3  # detik; lebih dari ini langsung balas error daripada menahan worker
+_req_times = deque()
+_req_lock = threading.Lock()
+
+# Batasi jumlah request paralel ke upstream supaya burst cache-miss tidak memicu 429
+UPSTREAM_MAX_CONCURRENCY = 8
+_upstream_sema = threading.BoundedSemaphore(UPSTREAM_MAX_CONCURRENCY)
+
+# Retry-After dari upstream dihormati, tapi jangan sampai worker tertahan terlalu lama
+MAX_RETRY_AFTER = 10
+MAX_RETRY_AFTER_ATTEMPTS = 1
+
+def _rate_limit_wait():
+    """Ambil slot di sliding window; False kalau harus menunggu lebih dari RATE_LIMIT_MAX_WAIT."""
+    deadline = time.monotonic() + RATE_LIMIT_MAX_WAIT
+    while True:
+        with _req_lock:
+            now = time.monotonic()
+            while _req_times and now - _req_times[0] > 60:
+                _req_times.popleft()
+            if len(_req_times) < RATE_LIMIT_RPM:
+                _req_times.append(now)
+                return True
+            wait = max(60 - (now - _req_times[0]), 0.05)
+        if now + wait > deadline:
+            return False
+        time.sleep(wait)
+
+# ============ SINGLE-FLIGHT ============
+# Request identik yang sedang berjalan cukup di-fetch sekali, sisanya menunggu hasilnya
+INFLIGHT_WAIT_TIMEOUT = 20
+_inflight = {}
+_inflight_lock = threading.Lock()
 
 def fetch_api(endpoint, cache_type='home'):
     cache_key = f"{cache_type}_{endpoint}"
     cached_data = get_from_cache(cache_key)
     if cached_data is not None:
         return cached_data
+    return _fetch_coalesced(endpoint, cache_key, cache_type)
+
+def _fetch_coalesced(endpoint, cache_key, cache_type):
+    with _inflight_lock:
+        flight = _inflight.get(cache_key)
+        leader = flight is None
+        if leader:
+            flight = {'event': threading.Event(), 'data': None}
+            _inflight[cache_key] = flight
+
+    if not leader:
+        if flight['event'].wait(timeout=INFLIGHT_WAIT_TIMEOUT) and flight['data'] is not None:
+            return flight['data']
+        return {"status": "error", "message": "Request timeout, coba lagi nanti"}
+
+    try:
+        flight['data'] = _fetch_upstream(endpoint, cache_key, cache_type)
+        return flight['data']
+    finally:
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+        flight['event'].set()
+
+def fetch_api_gzip(endpoint, cache_type='home'):
+    """Seperti fetch_api, tapi mengembalikan blob JSON gzip; cache hit langsung dikirim tanpa decode/encode."""
+    cache_key = f"{cache_type}_{endpoint}"
+    blob = get_blob_from_cache(cache_key)
+    if blob is not None:
+        return blob
+    data = _fetch_coalesced(endpoint, cache_key, cache_type)
+    # Hasil sukses sudah di-encode oleh save_to_cache; hanya error (tidak di-cache) yang di-encode di sini
+    blob = get_blob_from_cache(cache_key)
+    return blob if blob is not None else gzip_bytes(dump_json_bytes(data))
+
+def _sync_rate_limit_headers(response):
+    """Samakan sliding window lokal dengan sisa kuota yang dilaporkan upstream."""
     try:
-        response = requests.get(f"{API_BASE}{endpoint}", timeout=10)
+        remaining = int(response.headers['X-RateLimit-Remaining'])
+        limit = int(response.headers['X-RateLimit-Limit'])
+    except (KeyError, ValueError):
+        return
+    if limit <= 0 or remaining >= limit * 0.1:
+        return
+    with _req_lock:
+        now = time.monotonic()
+        target = RATE_LIMIT_RPM - remaining
+        while len(_req_times) < target:
+            _req_times.append(now)
+    print(f"⚠️ Upstream quota low ({remaining}/{limit}), throttling")
+
+def _retry_after_seconds(response):
+    try:
+        retry_after = float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+    return retry_after if retry_after >= 0 else None
+
+def _fetch_upstream(endpoint, cache_key, cache_type):
+    try:
+        for attempt in range(MAX_RETRY_AFTER_ATTEMPTS + 1):
+            if not _rate_limit_wait():
+                return {"status": "error", "message": "Rate limit exceeded, coba lagi nanti"}
+            with _upstream_sema:
+                response = SESSION.get(f"{API_BASE}{endpoint}", timeout=10)
+            _sync_rate_limit_headers(response)
+            retry_after = _retry_after_seconds(response)
+            if response.status_code in (429, 503) and retry_after is not None \
+                    and 0 <= retry_after <= MAX_RETRY_AFTER and attempt < MAX_RETRY_AFTER_ATTEMPTS:
+                print(f"⚠️ Upstream asked to retry after {retry_after}s: {endpoint}")
+                time.sleep(retry_after)
+                continue
+            break
         # Handle rate limit
         if response.status_code == 429:
             return {"status": "error", "message": "Rate limit exceeded, coba lagi nanti"}
@@ -201,46 +417,97 @@ def fetch_api(endpoint, cache_type='home'):
 
 # ============ IMAGE PROXY FUNCTIONS ============
 def get_image_cache_path(url):
-    url_hash = hashlib.md5(url.encode()).hexdigest()
+    url_hash = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
     return os.path.join(IMAGE_CACHE_DIR, f'{url_hash}.jpg')
 
 def is_image_cached(url):
     cache_path = get_image_cache_path(url)
     if not os.path.exists(cache_path):
         return False
-    if url in IMAGE_CACHE:
-        cached_at = IMAGE_CACHE[url].get('cached_at')
-        if cached_at:
-            cached_date = datetime.fromisoformat(cached_at)
-            if datetime.now() < cached_date + timedelta(days=IMAGE_CACHE_DURATION_DAYS):
-                return True
-    file_stat = os.stat(cache_path)
-    file_age = datetime.now() - datetime.fromtimestamp(file_stat.st_mtime)
-    if file_age < timedelta(days=IMAGE_CACHE_DURATION_DAYS):
-        IMAGE_CACHE[url] = {
-            'path': cache_path,
-            'cached_at': datetime.fromtimestamp(file_stat.st_mtime).isoformat(),
-            'hits': IMAGE_CACHE.get(url, {}).get('hits', 0)
-        }
-        return True
+    with _cache_lock:
+        if url in IMAGE_CACHE:
+            cached_at = IMAGE_CACHE[url].get('cached_at')
+            if cached_at:
+                cached_date = datetime.fromisoformat(cached_at)
+                if datetime.now() < cached_date + timedelta(days=IMAGE_CACHE_DURATION_DAYS):
+                    IMAGE_CACHE.move_to_end(url)
+                    return True
+        file_stat = os.stat(cache_path)
+        file_age = datetime.now() - datetime.fromtimestamp(file_stat.st_mtime)
+        if file_age < timedelta(days=IMAGE_CACHE_DURATION_DAYS):
+            _save_image_entry(url, {
+                'path': cache_path,
+                'cached_at': datetime.fromtimestamp(file_stat.st_mtime).isoformat(),
+                'hits': IMAGE_CACHE.get(url, {}).get('hits', 0)
+            })
+            return True
     return False
 
+def _save_image_entry(url, entry):
+    with _cache_lock:
+        if url in IMAGE_CACHE:
+            IMAGE_CACHE.move_to_end(url)
+        elif len(IMAGE_CACHE) >= MAX_IMAGES:
+            # Hapus juga file di /tmp supaya disk ikut terbatas
+            _, evicted = IMAGE_CACHE.popitem(last=False)
+            try:
+                os.remove(evicted['path'])
+            except OSError:
+                pass
+        IMAGE_CACHE[url] = entry
+
 def cache_image(url, image_content):
     cache_path = get_image_cache_path(url)
     try:
         with open(cache_path, 'wb') as f:
             f.write(image_content)
-        IMAGE_CACHE[url] = {
+        _save_image_entry(url, {
             'path': cache_path,
             'cached_at': datetime.now().isoformat(),
             'hits': 0,
-            'size': len(image_content)
-        }
+            'size': len(image_content),
+            'etag': hashlib.blake2b(image_content, digest_size=16).hexdigest()
+        })
         return cache_path
     except Exception as e:
         print(f"Error caching image: {e}")
         return None
 
+def get_image_etag(url, cache_path):
+    """ETag dari isi file; entry yang diadopsi dari disk dihitung sekali lalu disimpan."""
+    with _cache_lock:
+        entry = IMAGE_CACHE.get(url)
+        if entry and entry.get('etag'):
+            return entry['etag']
+    with open(cache_path, 'rb') as f:
+        etag = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    with _cache_lock:
+        if url in IMAGE_CACHE:
+            IMAGE_CACHE[url]['etag'] = etag
+    return etag
+
+# ============ CACHE JANITOR ============
+def _cache_janitor():
+    """Bersihkan entry expired secara berkala, bukan cuma saat diakses."""
+    while True:
+        time.sleep(CACHE_SWEEP_INTERVAL)
+        now = datetime.now()
+        mono_now = time.monotonic()
+        with _cache_lock:
+            for key, (cached_time, cache_type, _) in list(CACHE.items()):
+                if mono_now - cached_time > CACHE_DURATION.get(cache_type, DEFAULT_TTL):
+                    del CACHE[key]
+            for url, entry in list(IMAGE_CACHE.items()):
+                cached_at = entry.get('cached_at')
+                if cached_at and now - datetime.fromisoformat(cached_at) > timedelta(days=IMAGE_CACHE_DURATION_DAYS):
+                    del IMAGE_CACHE[url]
+                    try:
+                        os.remove(entry['path'])
+                    except OSError:
+                        pass
+
+threading.Thread(target=_cache_janitor, daemon=True).start()
+
 # ============ IMAGE PROXY ROUTE ============
 @app.route('/api/proxy-image', methods=['GET', 'OPTIONS'])
 def proxy_image():
@@ -257,10 +524,16 @@ def proxy_image():
 
     if is_image_cached(image_url):
         cache_path = get_image_cache_path(image_url)
-        if image_url in IMAGE_CACHE:
-            IMAGE_CACHE[image_url]['hits'] = IMAGE_CACHE[image_url].get('hits', 0) + 1
+        with _cache_lock:
+            if image_url in IMAGE_CACHE:
+                IMAGE_CACHE[image_url]['hits'] = IMAGE_CACHE[image_url].get('hits', 0) + 1
         try:
-            response = send_file(cache_path, mimetype='image/jpeg', as_attachment=False)
+            etag = get_image_etag(image_url, cache_path)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = send_file(cache_path, mimetype='image/jpeg', as_attachment=False, etag=False)
+            response.set_etag(etag)
             response.headers['Access-Control-Allow-Origin'] = '*'
             response.headers['X-Cache-Status'] = 'HIT'
             response.headers['Cache-Control'] = f'public, max-age={60*60*24*30}'
@@ -268,18 +541,35 @@ def proxy_image():
         except Exception as e:
             print(f"Error serving cached image: {e}")
 
+    img_response = None
+    streaming = False
     try:
-        img_response = requests.get(
-            image_url, timeout=10,
-            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        )
+        img_response = SESSION.get(image_url, stream=True, timeout=10)
         img_response.raise_for_status()
-        image_content = img_response.content
-        cache_image(image_url, image_content)
-        response = Response(image_content, mimetype=img_response.headers.get('Content-Type', 'image/jpeg'))
+
+        # Stream ke client sambil dikumpulkan; cache hanya kalau download selesai & tidak terlalu besar
+        buf = bytearray()
+        state = {'complete': False}
+
+        def gen():
+            for chunk in img_response.iter_content(IMAGE_STREAM_CHUNK):
+                if len(buf) <= IMAGE_CACHE_MAX_BYTES:
+                    buf.extend(chunk)
+                yield chunk
+            state['complete'] = True
+
+        def cache_after_stream():
+            if state['complete'] and len(buf) <= IMAGE_CACHE_MAX_BYTES:
+                cache_image(image_url, bytes(buf))
+
+        response = Response(gen(), mimetype=img_response.headers.get('Content-Type', 'image/jpeg'))
+        # Koneksi dikembalikan ke pool saat response ditutup, walau generator belum sempat jalan
+        response.call_on_close(img_response.close)
+        response.call_on_close(cache_after_stream)
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['X-Cache-Status'] = 'MISS'
         response.headers['Cache-Control'] = f'public, max-age={60*60*24*30}'
+        streaming = True
         return response
     except requests.exceptions.Timeout:
         return jsonify({'error': 'Request timeout'}), 504
@@ -287,6 +577,9 @@ def proxy_image():
         return jsonify({'error': f'Failed to fetch image: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Internal error: {str(e)}'}), 500
+    finally:
+        if img_response is not None and not streaming:
+            img_response.close()
 
 @app.route('/api/image-cache/stats')
 def image_cache_stats():
@@ -296,7 +589,8 @@ def image_cache_stats():
             os.path.getsize(os.path.join(IMAGE_CACHE_DIR, f))
             for f in os.listdir(IMAGE_CACHE_DIR) if f.endswith('.jpg')
         )
-        total_hits = sum(cache.get('hits', 0) for cache in IMAGE_CACHE.values())
+        with _cache_lock:
+            total_hits = sum(cache.get('hits', 0) for cache in IMAGE_CACHE.values())
         return jsonify({
             'status': 'success',
             'data': {
@@ -377,16 +671,26 @@ def api_remove_bookmark():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# ============ EDGE CACHE ============
+PUBLIC_PAGE_CACHE_CONTROL = 'public, s-maxage=600, stale-while-revalidate=60'
+
+def public_page(template, data):
+    """Render halaman publik; versi anonim & sukses boleh di-cache CDN Vercel."""
+    resp = make_response(render_template(template, data=data))
+    # base.html menampilkan info user dari session, jadi halaman login tidak boleh di-cache publik
+    if 'user' not in session and not (isinstance(data, dict) and data.get('status') == 'error'):
+        resp.headers['Cache-Control'] = PUBLIC_PAGE_CACHE_CONTROL
+    return resp
+
 # ============ ANIME ROUTES ============
 @app.route('/')
 def index():
     data = fetch_api('/anime/home', 'home')
-    return render_template('home.html', data=data)
+    return public_page('home.html', data)
 
 @app.route('/api/home')
 def api_home():
-    data = fetch_api('/anime/home', 'home')
-    return jsonify(data)
+    return json_response(fetch_api_gzip('/anime/home', 'home'))
 
 @app.route('/anime/<anime_id>')
 def anime_detail(anime_id):
@@ -399,40 +703,37 @@ def anime_detail(anime_id):
 
 @app.route('/api/anime/<anime_id>')
 def api_anime_detail(anime_id):
-    data = fetch_api(f'/anime/anime/{anime_id}', 'anime')
-    return jsonify(data)
+    return json_response(fetch_api_gzip(f'/anime/anime/{anime_id}', 'anime'))
 
 @app.route('/ongoing')
 def ongoing():
     page = request.args.get('page', 1, type=int)
     data = fetch_api(f'/anime/ongoing-anime?page={page}', 'ongoing')
-    return render_template('ongoing.html', data=data)
+    return public_page('ongoing.html', data)
 
 @app.route('/completed')
 def completed():
     page = request.args.get('page', 1, type=int)
     data = fetch_api(f'/anime/complete-anime?page={page}', 'completed')
-    return render_template('completed.html', data=data)
+    return public_page('completed.html', data)
 
 @app.route('/schedule')
 def schedule():
     data = fetch_api('/anime/schedule', 'schedule')
-    return render_template('schedule.html', data=data)
+    return public_page('schedule.html', data)
 
 @app.route('/api/schedule')
 def api_schedule():
-    data = fetch_api('/anime/schedule', 'schedule')
-    return jsonify(data)
+    return json_response(fetch_api_gzip('/anime/schedule', 'schedule'))
 
 @app.route('/all-anime')
 def all_anime():
     data = fetch_api('/anime/unlimited', 'unlimited')
-    return render_template('all_anime.html', data=data)
+    return public_page('all_anime.html', data)
 
 @app.route('/api/all-anime')
 def api_all_anime():
-    data = fetch_api('/anime/unlimited', 'unlimited')
-    return jsonify(data)
+    return json_response(fetch_api_gzip('/anime/unlimited', 'unlimited'))
 
 @app.route('/episode/<episode_id>')
 def episode_detail(episode_id):
@@ -445,8 +746,7 @@ def episode_detail(episode_id):
 
 @app.route('/api/episode/<episode_id>')
 def api_episode_detail(episode_id):
-    data = fetch_api(f'/anime/episode/{episode_id}', 'episode')
-    return jsonify(data)
+    return json_response(fetch_api_gzip(f'/anime/episode/{episode_id}', 'episode'))
 
 @app.route('/search')
 def search():
@@ -458,13 +758,11 @@ def search():
 
 @app.route('/api/search/<keyword>')
 def api_search(keyword):
-    data = fetch_api(f'/anime/search/{keyword}', 'search')
-    return jsonify(data)
+    return json_response(fetch_api_gzip(f'/anime/search/{keyword}', 'search'))
 
 @app.route('/api/server/<server_id>')
 def api_server(server_id):
-    data = fetch_api(f'/anime/server/{server_id}', 'server')
-    return jsonify(data)
+    return json_response(fetch_api_gzip(f'/anime/server/{server_id}', 'server'))
 
 @app.route('/batch/<slug>')
 def batch_download(slug):
@@ -473,18 +771,16 @@ def batch_download(slug):
 
 @app.route('/api/batch/<slug>')
 def api_batch(slug):
-    data = fetch_api(f'/anime/batch/{slug}', 'batch')
-    return jsonify(data)
+    return json_response(fetch_api_gzip(f'/anime/batch/{slug}', 'batch'))
 
 @app.route('/genres')
 def genres():
     data = fetch_api('/anime/genre', 'genre')
-    return render_template('genres.html', data=data)
+    return public_page('genres.html', data)
 
 @app.route('/api/genres')
 def api_genres():
-    data = fetch_api('/anime/genre', 'genre')
-    return jsonify(data)
+    return json_response(fetch_api_gzip('/anime/genre', 'genre'))
 
 @app.route('/genre/<genre_id>')
 def genre_detail(genre_id):
@@ -494,8 +790,7 @@ def genre_detail(genre_id):
 
 @app.route('/api/genre/<genre_id>')
 def api_genre_detail(genre_id):
-    data = fetch_api(f'/anime/genre/{genre_id}', 'genre')
-    return jsonify(data)
+    return json_response(fetch_api_gzip(f'/anime/genre/{genre_id}', 'genre'))
 
 # ============ HISTORY (Supabase) ============
 def get_user_id():
@@ -771,6 +1066,14 @@ def api_delete_chat(msg_id):
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+# ============ DATABASE ============
+@app.teardown_appcontext
+def close_db_connections(exc):
+    # database.py tidak di-import di sini; tutup koneksi per-thread hanya kalau modulnya dipakai
+    db = sys.modules.get('database')
+    if db is not None:
+        db.close_connections()
+
 # ============ ERROR HANDLERS ============
 @app.errorhandler(404)
 def not_found(e):
@@ -1,14 +1,48 @@
 import sqlite3
+import threading
 from datetime import datetime
 import json
 
-class NotificationDB:
+DB_PATH = 'notifications.db'
+
+def apply_pragmas(conn):
+    # Pragma per-koneksi; journal_mode=WAL tersimpan di file DB jadi cukup diset di create_table
+    # synchronous=NORMAL hindari fsync tiap commit
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-20000')
+
+class ThreadLocalConnection:
+    """Satu koneksi SQLite per thread; dengan WAL, reader tidak saling menunggu."""
+    def __init__(self):
+        self._local = threading.local()
+    
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(DB_PATH)
+            apply_pragmas(conn)
+            self._local.conn = conn
+        return conn
+    
+    def close(self):
+        """Tutup koneksi milik thread ini (dipanggil dari teardown request)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class NotificationDB(ThreadLocalConnection):
     def __init__(self):
-        self.conn = sqlite3.connect('notifications.db', check_same_thread=False)
+        super().__init__()
         self.create_table()
+        # Cache episode_id yang sudah di-track supaya polling tidak query SQLite per episode
+        self.tracked_ids = {row[0] for row in self.conn.execute('SELECT episode_id FROM tracked_episodes')}
     
     def create_table(self):
         cursor = self.conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS notifications (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -20,6 +54,8 @@ class NotificationDB:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notif_unread_time ON notifications(is_read, created_at DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notif_time ON notifications(created_at DESC)')
         
         # Table untuk tracking episode yang sudah dicek
         cursor.execute('''
@@ -41,6 +77,14 @@ class NotificationDB:
         self.conn.commit()
         return cursor.lastrowid
     
+    def add_notifications_bulk(self, rows):
+        """rows: iterable of (type, title, message, link), disimpan dalam satu commit."""
+        self.conn.executemany('''
+            INSERT INTO notifications (type, title, message, link)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+        self.conn.commit()
+    
     def get_notifications(self, limit=10, unread_only=False):
         cursor = self.conn.cursor()
         query = 'SELECT * FROM notifications'
@@ -84,9 +128,7 @@ class NotificationDB:
     
     # Tracking episodes
     def is_episode_tracked(self, episode_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT episode_id FROM tracked_episodes WHERE episode_id = ?', (episode_id,))
-        return cursor.fetchone() is not None
+        return episode_id in self.tracked_ids
     
     def track_episode(self, episode_id, anime_title, episode_number):
         cursor = self.conn.cursor()
@@ -95,15 +137,19 @@ class NotificationDB:
             VALUES (?, ?, ?)
         ''', (episode_id, anime_title, episode_number))
         self.conn.commit()
+        self.tracked_ids.add(episode_id)
 
 
-class BookmarkDB:
+class BookmarkDB(ThreadLocalConnection):
+    ALLOWED_SORT = {'created_at', 'title', 'rating'}
+    
     def __init__(self):
-        self.conn = sqlite3.connect('notifications.db', check_same_thread=False)
+        super().__init__()
         self.create_table()
     
     def create_table(self):
         cursor = self.conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS bookmarks (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -116,6 +162,9 @@ class BookmarkDB:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bm_created ON bookmarks(created_at DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bm_title ON bookmarks(title DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bm_rating ON bookmarks(rating DESC)')
         self.conn.commit()
     
     def add_bookmark(self, anime_id, title, poster=None, status=None, rating=None, total_episode=None):
@@ -143,11 +192,14 @@ class BookmarkDB:
     
     def get_bookmarks(self, limit=None, sort_by='created_at'):
         cursor = self.conn.cursor()
-        query = f'SELECT * FROM bookmarks ORDER BY {sort_by} DESC'
+        column = sort_by if sort_by in self.ALLOWED_SORT else 'created_at'
+        query = f'SELECT * FROM bookmarks ORDER BY {column} DESC'
+        params = ()
         if limit:
-            query += f' LIMIT {limit}'
+            query += ' LIMIT ?'
+            params = (limit,)
         
-        cursor.execute(query)
+        cursor.execute(query, params)
         bookmarks = []
         for row in cursor.fetchall():
             bookmarks.append({
@@ -174,4 +226,8 @@ class BookmarkDB:
 
 # Instance global
 notif_db = NotificationDB()
-bookmark_db = BookmarkDB()
\ No newline at end of file
+bookmark_db = BookmarkDB()
+
+def close_connections():
+    notif_db.close()
+    bookmark_db.close()
\ No newline at end of file